@@ -0,0 +1,154 @@
+import math
+import numpy as np
+from collections import OrderedDict
+
+CHUNK_SIZE = 256 #Agents whose draws are generated together in one vectorized call
+BLOCK_SIZE = 16 #Uniforms per agent and block of AgentRandom (a multiple of 4)
+CACHED_BLOCKS = 128 #Chunk blocks kept for the other agents of their chunk (32 KB each)
+
+ROUTINE = 0 #Stream tag of the draws served by AgentRandom; other tags are free for attributes
+
+
+class AgentStreams(object):
+    '''Counter-based (Philox) random numbers keyed by (run_seed, agent_id)
+        The values of an agent are fixed by the Philox key (run_seed) and a counter made of
+        (tag, agent chunk, epoch); the agent's row within the chunk selects its values.
+        Draws are therefore independent of the order in which agents ask for them.
+        The first agent of a chunk to need a block draws it for all CHUNK_SIZE agents at
+        once; the others copy their row out while it is cached. An agent whose block was
+        dropped already, or whose chunk is mostly gone (dead agents), jumps the counter
+        to its own row and draws only that.
+
+        Args:
+            run_seed (int): Seed of the run; the same seed reproduces every agent's draws
+            block_size (int): Number of uniforms per agent in each block of AgentRandom
+            cached_blocks (int): Number of chunk blocks kept
+    '''
+
+    GLOBAL = 0 #Stream id for draws that don't belong to an agent (agent ids start at 1)
+
+    def __init__(self, run_seed, block_size=BLOCK_SIZE, cached_blocks=CACHED_BLOCKS):
+        if not 0 <= run_seed < 2**128:
+            raise ValueError(f'run_seed has to be in [0, 2**128): {run_seed}')
+        if block_size % 4:
+            raise ValueError(f'block_size has to be a multiple of 4: {block_size}')
+        self.run_seed = run_seed
+        self.block_size = block_size
+        self.cached_blocks = cached_blocks
+        #one bit generator for the run, moved to the counter of each draw (cheaper than a new one)
+        self._bit_generator = np.random.Philox(key=run_seed)
+        self._generator = np.random.Generator(self._bit_generator)
+        self._state = self._bit_generator.state
+        self._blocks = OrderedDict() #(chunk, epoch) -> [values, rows taken], least recently used first
+        self._latest = {}   #chunk -> latest epoch drawn for the whole chunk
+        self._sparse = set()    #chunks whose blocks were dropped with few rows taken
+        self._recent = {}   #(tag, size, normal) -> (chunk, values) of the last attribute chunk
+
+    def _generate(self, tag, chunk, epoch, shape, normal=False, offset=0):
+        '''Draws values from the stream of (tag, chunk, epoch), starting offset Philox
+            blocks (4 x 64 bit, i.e. 4 uniforms) into it'''
+        state = dict(self._state)
+        state['state'] = {'counter': np.array([offset, chunk, epoch, tag], dtype=np.uint64),
+                          'key': self._state['state']['key']}
+        self._bit_generator.state = state
+        draw = self._generator.standard_normal if normal else self._generator.random
+        return draw(shape)
+
+    def _chunk(self, tag, chunk, size, normal):
+        '''Returns the attribute values of all agents of a chunk, shape (CHUNK_SIZE, size)'''
+        recent = self._recent.get((tag, size, normal))
+        if recent is not None and recent[0] == chunk:
+            return recent[1]
+        values = self._generate(tag, chunk, 0, (CHUNK_SIZE, size), normal)
+        #keeps the latest chunk, e.g. for agents born one after another
+        self._recent[(tag, size, normal)] = (chunk, values)
+        return values
+
+    def _draw(self, agent_ids, size, tag, normal):
+        if tag == ROUTINE:
+            raise ValueError(f'Tag {ROUTINE} is reserved for AgentRandom')
+        agent_ids = np.asarray(agent_ids, dtype=np.int64)
+        chunks, rows = np.divmod(agent_ids, CHUNK_SIZE)
+        unique, position = np.unique(chunks, return_inverse=True)
+        values = np.stack([self._chunk(tag, chunk, size, normal) for chunk in unique.tolist()])
+        return values[position, rows].reshape(len(agent_ids), size)
+
+    def uniform(self, agent_ids, size, tag):
+        '''Uniforms in [0, 1) of shape (len(agent_ids), size), one row per agent'''
+        return self._draw(agent_ids, size, tag, normal=False)
+
+    def normal(self, agent_ids, size, tag):
+        '''Standard normals of shape (len(agent_ids), size), one row per agent'''
+        return self._draw(agent_ids, size, tag, normal=True)
+
+    def block(self, agent_id, epoch):
+        '''Returns the epoch-th block of uniforms of an agent (its own copy)'''
+        chunk, row = divmod(agent_id, CHUNK_SIZE)
+        entry = self._blocks.get((chunk, epoch))
+        if entry is None:
+            if chunk in self._sparse or epoch <= self._latest.get(chunk, -1):
+                return self._generate(ROUTINE, chunk, epoch, self.block_size, offset=row * self.block_size // 4)
+            entry = self._blocks[(chunk, epoch)] = [
+                self._generate(ROUTINE, chunk, epoch, (CHUNK_SIZE, self.block_size)), 0]
+            self._latest[chunk] = epoch
+            if len(self._blocks) > self.cached_blocks:
+                (dropped, _), (_, taken) = self._blocks.popitem(last=False)
+                if taken < CHUNK_SIZE // 4:
+                    self._sparse.add(dropped)
+        else:
+            self._blocks.move_to_end((chunk, epoch))
+        entry[1] += 1
+        return entry[0][row].copy()
+
+    def stream(self, agent_id):
+        return AgentRandom(self, agent_id)
+
+
+class AgentRandom(object):
+    '''Random numbers of a single agent, served from its blocks in AgentStreams
+        Provides the subset of the `random` module used by the simulation:
+            random(), randint(a, b), gauss(mu, sigma), choices(population, k), sample(population, k)
+    '''
+
+    __slots__ = ('streams', 'agent_id', '_epoch', '_block', '_i')
+
+    def __init__(self, streams, agent_id):
+        self.streams = streams
+        self.agent_id = agent_id
+        self._epoch = 0
+        self._block = () #fetched with the first draw
+        self._i = 0
+
+    def random(self):
+        '''Uniform float in [0, 1)'''
+        if self._i == len(self._block):
+            self._block = self.streams.block(self.agent_id, self._epoch)
+            self._epoch += 1
+            self._i = 0
+        value = self._block[self._i]
+        self._i += 1
+        return value
+
+    def randint(self, a, b):
+        '''Integer in [a, b], both included (like random.randint)'''
+        return a + int(self.random() * (b - a + 1))
+
+    def gauss(self, mu=0.0, sigma=1.0):
+        '''Normal deviate (Box-Muller)'''
+        u = 1.0 - self.random()
+        return mu + sigma * math.sqrt(-2.0 * math.log(u)) * math.cos(2.0 * math.pi * self.random())
+
+    def choices(self, population, k=1):
+        '''k elements of population, drawn with replacement'''
+        return [population[int(self.random() * len(population))] for _ in range(k)]
+
+    def sample(self, population, k):
+        '''k distinct elements of population, drawn without replacement'''
+        if not 0 <= k <= len(population):
+            raise ValueError(f'Sample larger than population: {k}')
+        chosen, pool = [], list(range(len(population)))
+        for i in range(k):
+            j = i + int(self.random() * (len(pool) - i))
+            pool[i], pool[j] = pool[j], pool[i]
+            chosen.append(population[pool[i]])
+        return chosen
@@ -0,0 +1,244 @@
+import numpy as np
+
+from sim_epidemic import PARAMETERS, parameter_arrays
+
+CHUNK_SIZE = 2**16 #Parameter sets per chunk for the numerical integration in peak
+
+
+def removal_rate(p):
+    '''Rate of leaving the (transmitting) infectious class I: γ + δ + ωs + ωi + μ'''
+    return p['γ'] + p['δ'] + p['ωs'] + p['ωi'] + p['μ']
+
+
+def disease_free_equilibrium(params):
+    """Disease-free equilibrium of the SIRXD equations as fractions of N
+
+    Susceptibles are quarantined with ωs and released with ωe, so without infection
+    S and Xs settle at (ωe + μ) : ωs.
+
+    Returns:
+        (dict): 'S' and 'Xs' fraction of the population
+    """
+    p = parameter_arrays(params)
+    total = p['ωs'] + p['ωe'] + p['μ']
+    s = np.divide(p['ωe'] + p['μ'], total, out=np.ones_like(total), where=total > 0)
+    return {'S': s, 'Xs': 1.0 - s}
+
+
+def basic_reproduction_number(params):
+    """R0 of the SIRXD equations via the next-generation matrix at the disease-free equilibrium
+
+    Infected classes are I and Xi; only I transmits. With the transmission matrix
+    F = [[β S/N, 0], [0, 0]] and the transition matrix V = [[a, 0], [-(ωs + ωi), γ + δ + μ]],
+    a = γ + δ + ωs + ωi + μ, the spectral radius of F V^-1 is β S/N / a.
+
+    Args:
+        params: see parameter_arrays
+
+    Returns:
+        (ndarray): R0 for each parameter set
+    """
+    p = parameter_arrays(params)
+    a = removal_rate(p)
+    s = disease_free_equilibrium(p)['S']
+    return np.divide(p['β'] * s, a, out=np.full_like(a, np.inf), where=a > 0)
+
+
+def effective_reproduction_number(params, S, N):
+    '''Reff = β S/N / a for the current number of susceptible individuals'''
+    p = parameter_arrays(params)
+    a = removal_rate(p)
+    return np.divide(p['β'] * np.divide(S, N), a, out=np.full_like(a, np.inf), where=a > 0)
+
+
+def infection_fatality_ratio(params):
+    '''Probability that an infection ends in Di, directly from I or after quarantine in Xi'''
+    p = parameter_arrays(params)
+    a = removal_rate(p)
+    b = p['γ'] + p['δ'] + p['μ']
+    from_i = np.divide(p['δ'], a, out=np.zeros_like(a), where=a > 0)
+    to_xi = np.divide(p['ωs'] + p['ωi'], a, out=np.zeros_like(a), where=a > 0)
+    from_xi = np.divide(p['δ'], b, out=np.zeros_like(b), where=b > 0)
+    return from_i + to_xi * from_xi
+
+
+def lambertw(x, iterations=12):
+    '''Principal branch W0 of the Lambert-W function for x >= -1/e (NaN below)'''
+    x = np.asarray(x, dtype=np.float64)
+    with np.errstate(all='ignore'):
+        #initial guess: branch point series, log1p, asymptotic expansion
+        p = np.sqrt(np.maximum(2.0 * (np.e * x + 1.0), 0.0))
+        l1 = np.log(np.maximum(x, 3.0))
+        l2 = np.log(l1)
+        w = np.where(x < -0.25, -1.0 + p - p**2 / 3.0 + 11.0 / 72.0 * p**3,
+            np.where(x < 3.0, np.log1p(np.maximum(x, -0.25)), l1 - l2 + l2 / l1))
+        #Halley iteration, only on the values that haven't converged yet
+        shape = w.shape
+        w, xs = w.ravel(), np.broadcast_to(x, shape).ravel()
+        active = np.flatnonzero(np.isfinite(w))
+        for _ in range(iterations):
+            if not len(active):
+                break
+            wa, xa = w[active], xs[active]
+            ew = np.exp(wa)
+            f = wa * ew - xa
+            step = f / (ew * (wa + 1.0) - (wa + 2.0) * f / (2.0 * wa + 2.0))
+            step = np.where(np.isfinite(step), step, 0.0)
+            w[active] = wa - step
+            active = active[np.abs(step) > 1e-15 * np.maximum(np.abs(wa), 1.0)]
+        w = w.reshape(shape)
+    return np.where(x < -1.0 / np.e, np.nan, w)
+
+
+def _initial_fractions(s0, i0):
+    i0 = np.asarray(i0, dtype=np.float64)
+    s0 = 1.0 - i0 if s0 is None else np.asarray(s0, dtype=np.float64)
+    return s0, i0
+
+
+def final_size(params, s0=None, i0=0.0):
+    """Fraction of the population infected over the whole outbreak (Lambert-W solution)
+
+    Uses the SIR reduction of the SIRXD equations (I removed with a = γ + δ + ωs + ωi + μ,
+    no births, no quarantine of susceptibles during the outbreak):
+        s∞ = s0 exp(-β/a (s0 + i0 - s∞))  ->  s∞ = -W0(-R s0 exp(-R (s0 + i0))) / R
+
+    Args:
+        params: see parameter_arrays
+        s0 (float or ndarray): Initial susceptible fraction (default: 1 - i0)
+        i0 (float or ndarray): Initial infectious fraction
+
+    Returns:
+        (ndarray): Attack rate s0 - s∞
+    """
+    p = parameter_arrays(params)
+    s0, i0 = _initial_fractions(s0, i0)
+    a = removal_rate(p)
+    R = np.divide(p['β'], a, out=np.full_like(a, np.inf), where=a > 0)
+    with np.errstate(all='ignore'):
+        s_end = -lambertw(-R * s0 * np.exp(-R * (s0 + i0))) / R
+    #R = 0: nobody gets infected, R = inf: everybody gets infected
+    s_end = np.where(R == 0, s0, np.where(np.isfinite(s_end), s_end, 0.0))
+    return s0 - s_end
+
+
+def peak(params, s0=None, i0=1e-6, nodes=32):
+    """Height and time of the peak of the infectious class I
+
+    Uses the SIR reduction of final_size. The peak is reached at s = a/β with
+        I_max = i0 + s0 - (1 + ln(s0 β/a)) a/β
+    and its time is the integral dt = -ds / (β s i(s)), evaluated by Gauss-Legendre
+    quadrature in log(s0 - s) for all parameter sets at once.
+
+    Args:
+        params: see parameter_arrays
+        s0 (float or ndarray): Initial susceptible fraction (default: 1 - i0)
+        i0 (float or ndarray): Initial infectious fraction, has to be > 0
+        nodes (int): Number of quadrature nodes; 0 skips the peak time (NaN where it grows)
+
+    Returns:
+        (ndarray, ndarray): Peak time (in units of the rates) and peak fraction of I;
+        time 0 and i0 where the outbreak doesn't grow
+    """
+    p = parameter_arrays(params)
+    s0, i0 = _initial_fractions(s0, i0)
+    β, a = p['β'], removal_rate(p)
+    β, a, s0, i0 = np.broadcast_arrays(β, a, s0, i0)
+    shape = β.shape
+    β, a, s0, i0 = (np.ravel(x) for x in (β, a, s0, i0))
+
+    with np.errstate(all='ignore'):
+        grows = s0 * β > a
+        s_peak = np.where(grows, a / β, s0)
+        i_peak = np.where(grows, i0 + s0 - s_peak - np.log(s0 / s_peak) * a / β, i0)
+
+    t_peak = np.zeros_like(β)
+    if not nodes:
+        t_peak[grows] = np.nan
+        return t_peak.reshape(shape), i_peak.reshape(shape)
+    x, w = np.polynomial.legendre.leggauss(nodes)
+    index = np.flatnonzero(grows)
+    for start in range(0, len(index), CHUNK_SIZE):
+        k = index[start:start + CHUNK_SIZE]
+        #y = log(s0 - s) from (practically) s = s0 to s = s_peak
+        lo = np.log(i0[k] * 1e-9)[:, None]
+        hi = np.log(s0[k] - s_peak[k])[:, None]
+        y = 0.5 * (hi - lo) * x + 0.5 * (hi + lo)
+        s = s0[k, None] - np.exp(y)
+        i = i0[k, None] + s0[k, None] - s + np.log(s / s0[k, None]) * (a[k] / β[k])[:, None]
+        integrand = np.exp(y) / (β[k, None] * s * i)
+        t_peak[k] = 0.5 * (hi - lo)[:, 0] * (integrand @ w)
+
+    return t_peak.reshape(shape), i_peak.reshape(shape)
+
+
+def endemic_equilibrium(params):
+    """Endemic equilibrium of the SIRXD equations as fractions of a constant N
+
+    With I > 0 the infectious class is stationary at S/N = a/β, the other classes follow
+    from the remaining equations:
+        I = (v - μ S - ωs μ S / (ωe + μ)) / a,  Xs = ωs S / (ωe + μ),
+        Xi = (ωs + ωi) I / (γ + δ + μ),         R = γ (I + Xi) / μ
+
+    Returns:
+        (dict): Fraction of each class, NaN where no endemic equilibrium exists (I <= 0)
+    """
+    p = parameter_arrays(params)
+    a = removal_rate(p)
+    with np.errstate(all='ignore'):
+        s = a / p['β']
+        xs = p['ωs'] * s / (p['ωe'] + p['μ'])
+        i = (p['v'] - p['μ'] * s - p['ωs'] * p['μ'] * s / (p['ωe'] + p['μ'])) / a
+        xi = (p['ωs'] + p['ωi']) * i / (p['γ'] + p['δ'] + p['μ'])
+        r = p['γ'] * (i + xi) / p['μ']
+    exists = (i > 0) & (s < 1) & np.isfinite(r)
+    return {name: np.where(exists, value, np.nan) for name, value in
+            (('S', s), ('I', i), ('R', r), ('Xs', xs), ('Xi', xi))}
+
+
+def screen(params, N, I=1, peak_time=True, nodes=16):
+    """Analytic summary of many parameter sets without simulation
+
+    The outbreak starts from the disease-free equilibrium, so R0, the final size and
+    the peak all use its susceptible fraction and agree on whether the outbreak grows.
+
+    Args:
+        params: see parameter_arrays
+        N (float or ndarray): Population size
+        I (float or ndarray): Initial number of infectious individuals
+        peak_time (bool): Compute the peak time (the numerical integration is the
+            most expensive part); NaN otherwise
+        nodes (int): Quadrature nodes of the peak time, see peak (16: ~0.3% error)
+
+    Returns:
+        (dict): 'R0', 'takes_off' (R0 > 1), 'attack_rate', 'infected' and 'deaths'
+        (absolute, whole outbreak), 'peak_time' and 'peak_infectious' (absolute)
+    """
+    p = parameter_arrays(params)
+    i0 = np.divide(I, N)
+    s0 = disease_free_equilibrium(p)['S']
+    R0 = basic_reproduction_number(p)
+    attack_rate = final_size(p, s0=s0, i0=i0)
+    t_peak, i_peak = peak(p, s0=s0, i0=i0, nodes=nodes if peak_time else 0)
+    return {
+        'R0': R0,
+        'takes_off': R0 > 1,
+        'attack_rate': attack_rate,
+        'infected': attack_rate * N,
+        'deaths': attack_rate * N * infection_fatality_ratio(p),
+        'peak_time': t_peak,
+        'peak_infectious': i_peak * N,
+    }
+
+
+if __name__ == "__main__":
+
+    # one million random candidates around the German parameters of corona.py
+    rng = np.random.default_rng(0)
+    n = 10**6
+    candidates = {'β': rng.uniform(0.05, 0.5, n), 'γ': 0.1, 'δ': 0.004, 'ωi': rng.uniform(0.0, 0.2, n)}
+    result = screen(candidates, N=83.2 * 10**6, I=1)
+
+    print(f"{np.count_nonzero(result['takes_off'])} of {n} candidates take off")
+    print(f"median deaths of those: {np.median(result['deaths'][result['takes_off']]):.0f}")
+    print(f"median peak time of those: {np.median(result['peak_time'][result['takes_off']]):.0f} days")
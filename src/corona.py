@@ -2,9 +2,11 @@ from copy import deepcopy
 import simpy
 
 import sim_epidemic as model
+from run_store import save_population
 
 STEP = 1 #Stepwidth; interpreted as days. Adjust the rates of EpidemicParameters to this value
 END = 175*10 #Simulates this number of steps
+RESULTS_DIRECTORY = None #Directory of a RunStore to save the populations in; None doesn't save
 
 class EpidemicParameters(object):
     '''Parameters for epidemic calculation with respect to SIRXD-model
@@ -186,35 +188,42 @@ class Population (object):
         for event in current_events:
             event.execute(self)
 
+    def _update_classes(self):
+        '''Advance the SIRXD classes by one step'''
+        #auto adabt birth rate to deaths in infected classes: infected and infected in quarantine 
+        # self.params.v = self.params.μ + (self.params.δ*(self.i_class+self.xi_class)*STEP)/self.n_class 
+
+        #simulate model
+        cS, cI, cR, cXs, cXi, cDn, cDi, cN = model.sirxd_update_population(S=self.s_class, I=self.i_class, R=self.r_class, 
+                                    Xs=self.xs_class, Xi=self.xi_class, Dn=self.dn_class, Di=self.di_class, 
+                                    β=self.params.β, γ=self.params.γ, δ=self.params.δ, κs=self.params.ωs, 
+                                    κi=self.params.ωi, κe=self.params.ωe, v=self.params.v, μ=self.params.μ, dt=STEP)
+        self.s_class, self.i_class, self.r_class, self.xs_class, self.xi_class = cS, cI, cR, cXs, cXi
+        self.dn_class, self.di_class, self.n_class = cDn, cDi, cN
+
+    def _save_classes(self):
+        '''Save values of current step'''
+        self.s_class_data.append(self.s_class)
+        self.i_class_data.append(self.i_class)
+        self.dn_class_data.append(self.dn_class)
+        self.di_class_data.append(self.di_class)
+        self.r_class_data.append(self.r_class)
+        self.xs_class_data.append(self.xs_class)
+        self.xi_class_data.append(self.xi_class)
+        self.n_class_data.append(self.n_class)
+
     def run(self):
         '''Population in process for SimPy'''
         while True:
             self._execute_events()
-
-            #auto adabt birth rate to deaths in infected classes: infected and infected in quarantine 
-            # self.params.v = self.params.μ + (self.params.δ*(self.i_class+self.xi_class)*STEP)/self.n_class 
-            
-            #simulate model
-            cS, cI, cR, cXs, cXi, cDn, cDi, cN = model.sirxd_update_population(S=self.s_class, I=self.i_class, R=self.r_class, 
-                                        Xs=self.xs_class, Xi=self.xi_class, Dn=self.dn_class, Di=self.di_class, 
-                                        β=self.params.β, γ=self.params.γ, δ=self.params.δ, κs=self.params.ωs, 
-                                        κi=self.params.ωi, κe=self.params.ωe, v=self.params.v, μ=self.params.μ, dt=STEP)
-            
-            #save values of current step
-            self.s_class = cS; self.s_class_data.append(cS)
-            self.i_class = cI; self.i_class_data.append(cI)
-            self.dn_class = cDn; self.dn_class_data.append(cDn)
-            self.di_class = cDi; self.di_class_data.append(cDi)
-            self.r_class = cR; self.r_class_data.append(cR)
-            self.xs_class = cXs; self.xs_class_data.append(cXs)
-            self.xi_class = cXi; self.xi_class_data.append(cXi)
-            self.n_class = cN; self.n_class_data.append(cN)
+            self._update_classes()
+            self._save_classes()
             
             #checkup and next step
             if self.s_class <= 0:
                 print("Die Population {} wurde ausgelöscht".format(self.name))
                 break
-            yield env.timeout(STEP)
+            yield self.env.timeout(STEP)
 
 def absolute_to_growrate(xn1, xn0, Δ01):
     return (xn1/xn0)**(1 / Δ01) - 1
@@ -225,12 +234,25 @@ def rate_relative(a, percentage):
                 => a will interpretted as 96% and b will be 0.1 / 96 * 4'''
     return a / (100 - percentage) * percentage
 
-def plot_population(populations):
-    '''Plot all given populations, each with its own figure.'''
+def population_data(population):
+    '''Returns the simulation results of the population in SIRXD order'''
+    return (population.s_class_data, population.i_class_data, population.r_class_data,
+            population.xs_class_data, population.xi_class_data, population.dn_class_data,
+            population.di_class_data, population.n_class_data)
+
+def plot_population(populations, ensemble=False):
+    '''Plot all given populations, each with its own figure.
+        With ensemble=True all populations are treated as runs of one scenario
+        and drawn into a single figure as quantile ribbons.'''
+    if ensemble:
+        model.sirxd_plot_ensemble([population_data(p) for p in populations],
+            title=', '.join(p.name for p in populations), figure=2, last_figure=True)
+        return
     i=2; last = len(populations)
     for population in populations:
+        #a population can end before END (e.g. when it was wiped out)
         model.sirxd_plot(
-            time=list(range(END+1)), 
+            time=[STEP * t for t in range(len(population.s_class_data))], 
             title=population.name,
             S=population.s_class_data,
             I=population.i_class_data, 
@@ -289,6 +311,10 @@ if __name__ == '__main__':
     print('Simulation started')
     env.run(until=END)
     print('Simulation finish succesfull')
+
+    if RESULTS_DIRECTORY:
+        for population in [pop_germany, pop_germanyII]:
+            save_population(RESULTS_DIRECTORY, population, metadata={'region': 'Deutschland'})
     
     #plot
     plot_population([pop_germany, pop_germanyII,])
@@ -0,0 +1,216 @@
+import numpy as np
+import simpy
+
+import corona
+from sim_epidemic import competing_exits
+
+AGENT = 'agent'
+COMPARTMENT = 'compartment'
+
+#agent states
+INFECTIOUS = 0
+INFECTIOUS_QUARANTINE = 1
+
+
+def stochastic_round(value, rng):
+    '''Rounds to one of the neighbouring integers, keeping the expected value'''
+    base = int(np.floor(value))
+    return base + int(rng.random() < value - base)
+
+
+class HybridPopulation(corona.Population):
+    ''' Population which switches between individual agents and SIRXD compartments by prevalence
+        While I + Xi is small every infected individual is an agent with its own number of
+        secondary cases and random contacts; S, R, Xs, Dn and Di are integer counts.
+        When I + Xi reaches agent_threshold the agents are aggregated into the deterministic
+        SIRXD classes of corona.Population; when it drops below compartment_threshold the
+        classes are split into agents again (stochastic rounding).
+
+        Parameter mapping (identical expected flows in both representations):
+            β: each infectious agent makes Poisson(β dt) infectious contacts,
+               a contact is susceptible with probability S/N
+            γ, δ, ωs, ωi, μ: an agent leaves its state with probability 1 - exp(-Σrates dt),
+               the destination is chosen proportional to the rates
+
+        Args (in addition to corona.Population):
+            agent_threshold (float): Switch to compartments when I + Xi reaches this value
+            compartment_threshold (float): Switch back to agents when I + Xi drops below
+                this value (default: agent_threshold / 2)
+            seed (int): Seed of the random number generator of the agent mode
+
+        -> the representation of each step is stored in mode_data
+        -> secondary cases of agents are queried with secondary_cases, offspring_distribution
+           and case_reproduction_number (agents infected and removed in agent mode; agents split
+           from the classes were infectious before and their counts are incomplete)
+    '''
+
+    def __init__(self, env, name, agent_threshold=1000, compartment_threshold=None, seed=None, **kwargs):
+        super().__init__(env, name, **kwargs)
+        self.agent_threshold = agent_threshold
+        self.compartment_threshold = compartment_threshold if compartment_threshold is not None else agent_threshold / 2
+        self.rng = np.random.default_rng(seed)
+
+        self.agent_state = np.empty(0, dtype=np.int8)
+        self.agent_secondary = np.empty(0, dtype=np.int64)
+        self.agent_split = np.empty(0, dtype=bool) #split from the classes, secondary cases incomplete
+        self._offspring = np.zeros(1, dtype=np.int64) #index k: removed agents with k secondary cases
+
+        self.mode = COMPARTMENT
+        if self.i_class + self.xi_class < self.agent_threshold:
+            self._to_agents(split=False)
+        self.mode_data = [self.mode]
+
+    def _to_agents(self, split=True):
+        '''Split the SIRXD classes into integer counts and one agent per infected individual
+
+        Args:
+            split (bool): The infected individuals were infectious in compartment mode, so their
+                secondary cases are unknown; they are left out of the offspring distribution
+                (False at the start of the run, where nobody has infected anyone yet)
+        '''
+        rng = self.rng
+        self.s_class = stochastic_round(self.s_class, rng)
+        self.r_class = stochastic_round(self.r_class, rng)
+        self.xs_class = stochastic_round(self.xs_class, rng)
+        self.dn_class = stochastic_round(self.dn_class, rng)
+        self.di_class = stochastic_round(self.di_class, rng)
+        i, xi = stochastic_round(self.i_class, rng), stochastic_round(self.xi_class, rng)
+
+        self.agent_state = np.repeat(np.array([INFECTIOUS, INFECTIOUS_QUARANTINE], dtype=np.int8), [i, xi])
+        self.agent_secondary = np.zeros(i + xi, dtype=np.int64)
+        self.agent_split = np.full(i + xi, split)
+        self.mode = AGENT
+        self._count_agents()
+
+    def _to_compartments(self):
+        '''Aggregate the agents into the SIRXD classes
+            (their secondary cases are incomplete and not added to the offspring distribution)'''
+        self._count_agents()
+        self.agent_state = np.empty(0, dtype=np.int8)
+        self.agent_secondary = np.empty(0, dtype=np.int64)
+        self.agent_split = np.empty(0, dtype=bool)
+        self.mode = COMPARTMENT
+
+    def _count_agents(self):
+        self.i_class = int(np.count_nonzero(self.agent_state == INFECTIOUS))
+        self.xi_class = int(np.count_nonzero(self.agent_state == INFECTIOUS_QUARANTINE))
+        self.n_class = self.s_class + self.i_class + self.r_class + self.xs_class + self.xi_class
+
+    def _agent_exits(self, rates, mask):
+        '''Draw for every agent in mask whether and where it leaves (-1: stays)'''
+        dt = corona.STEP
+        total = sum(rates)
+        destination = np.full(np.count_nonzero(mask), -1)
+        if total <= 0:
+            return destination
+        leaves = self.rng.random(len(destination)) < -np.expm1(-total * dt)
+        choice = np.searchsorted(np.cumsum(rates) / total, self.rng.random(np.count_nonzero(leaves)), side='right')
+        destination[leaves] = np.minimum(choice, len(rates) - 1)
+        return destination
+
+    def _agent_step(self):
+        '''Advance counts and agents by one step'''
+        p, dt, rng = self.params, corona.STEP, self.rng
+        β, γ, δ = p.β or 0.0, p.γ or 0.0, p.δ or 0.0
+        ωs, ωi, ωe = p.ωs or 0.0, p.ωi or 0.0, p.ωe or 0.0
+        v, μ = p.v or 0.0, p.μ or 0.0
+        N = self.n_class
+
+        #infections: contacts of every infectious agent
+        infectious = self.agent_state == INFECTIOUS
+        contacts = rng.poisson(β * dt, size=np.count_nonzero(infectious))
+        secondary = rng.binomial(contacts, self.s_class / N if N > 0 else 0.0)
+        overshoot = int(secondary.sum()) - self.s_class
+        while overshoot > 0:
+            #more infections than susceptibles: take the surplus back from random infectors
+            index = rng.choice(np.flatnonzero(secondary), size=min(overshoot, np.count_nonzero(secondary)), replace=False)
+            secondary[index] -= 1
+            overshoot = int(secondary.sum()) - self.s_class
+        self.agent_secondary[infectious] += secondary
+        new_infections = int(secondary.sum())
+
+        #exits of agents
+        keep = np.ones(len(self.agent_state), dtype=bool)
+        recovered = died_infection = died_natural = 0
+        i_exit = self._agent_exits([γ, ωs + ωi, δ, μ], infectious)
+        quarantine = np.flatnonzero(infectious)[i_exit == 1]
+        quarantined = self.agent_state == INFECTIOUS_QUARANTINE
+        xi_exit = self._agent_exits([γ, δ, μ], quarantined)
+        keep[np.flatnonzero(infectious)[(i_exit == 0) | (i_exit == 2) | (i_exit == 3)]] = False
+        keep[np.flatnonzero(quarantined)[xi_exit >= 0]] = False
+        recovered += np.count_nonzero(i_exit == 0) + np.count_nonzero(xi_exit == 0)
+        died_infection += np.count_nonzero(i_exit == 2) + np.count_nonzero(xi_exit == 1)
+        died_natural += np.count_nonzero(i_exit == 3) + np.count_nonzero(xi_exit == 2)
+        self.agent_state[quarantine] = INFECTIOUS_QUARANTINE
+
+        #counted classes
+        S_infected = new_infections
+        S_Xs, S_Dn = competing_exits(rng, self.s_class - S_infected, [ωs, μ], dt)
+        Xs_S, Xs_Dn = competing_exits(rng, self.xs_class, [ωe, μ], dt)
+        R_Dn, = competing_exits(rng, self.r_class, [μ], dt)
+        births = int(rng.poisson(v * N * dt))
+
+        self.s_class += births + int(Xs_S) - S_infected - int(S_Xs) - int(S_Dn)
+        self.xs_class += int(S_Xs) - int(Xs_S) - int(Xs_Dn)
+        self.r_class += int(recovered) - int(R_Dn)
+        self.dn_class += int(died_natural) + int(S_Dn) + int(Xs_Dn) + int(R_Dn)
+        self.di_class += int(died_infection)
+
+        #final secondary cases of the agents that left (only complete ones)
+        removed = np.bincount(self.agent_secondary[~keep & ~self.agent_split], minlength=len(self._offspring))
+        self._offspring = np.pad(self._offspring, (0, len(removed) - len(self._offspring))) + removed
+
+        #keep surviving agents and add the newly infected
+        self.agent_state = np.concatenate((self.agent_state[keep], np.full(new_infections, INFECTIOUS, dtype=np.int8)))
+        self.agent_secondary = np.concatenate((self.agent_secondary[keep], np.zeros(new_infections, dtype=np.int64)))
+        self.agent_split = np.concatenate((self.agent_split[keep], np.zeros(new_infections, dtype=bool)))
+        self._count_agents()
+
+    def secondary_cases(self):
+        '''Returns the number of secondary cases so far of every current agent'''
+        return self.agent_secondary.copy()
+
+    def offspring_distribution(self):
+        '''Returns the number of removed agents with 0, 1, 2, ... secondary cases
+            (agents infected in agent mode only, see _to_agents)'''
+        return self._offspring.tolist()
+
+    def case_reproduction_number(self):
+        '''Mean number of secondary cases of the removed agents (see offspring_distribution)'''
+        removed = self._offspring.sum()
+        return float(np.arange(len(self._offspring)) @ self._offspring / removed) if removed else 0.0
+
+    def _update_classes(self):
+        '''Advance one step in the current representation and switch it if needed'''
+        if self.mode == AGENT:
+            self._agent_step()
+        else:
+            super()._update_classes()
+
+        infected = self.i_class + self.xi_class
+        if self.mode == AGENT and infected >= self.agent_threshold:
+            self._to_compartments()
+        elif self.mode == COMPARTMENT and infected < self.compartment_threshold:
+            self._to_agents()
+
+    def _save_classes(self):
+        super()._save_classes()
+        self.mode_data.append(self.mode)
+
+
+if __name__ == '__main__':
+
+    env = simpy.Environment()
+    params = corona.EpidemicParameters(β=0.25, γ=0.1, δ=0.002, ωi=0.02, v=0.00003, μ=0.00003)
+
+    populations = [HybridPopulation(env, f'Hybrid {i}', n_class_cap=10**6, i_class_cap=3,
+        epidemic_params=params, agent_threshold=500, seed=i) for i in range(10)]
+
+    print('Simulation started')
+    env.run(until=365)
+    for population in populations:
+        switch = population.mode_data.index(COMPARTMENT) if COMPARTMENT in population.mode_data else None
+        print(f'{population.name}: compartments from step {switch}, deceased {population.di_class:.0f}, '
+              f'Rc of agents infected and removed in agent mode {population.case_reproduction_number():.2f}')
+
+    corona.plot_population(populations, ensemble=True)
@@ -0,0 +1,190 @@
+from array import array
+import numpy as np
+
+
+class RollingWindow(object):
+    '''Fixed size ring buffer with a running sum
+        Pushing a value and reading sum/mean is O(1), independent of the window length.
+
+        Args:
+            length (int): Number of values kept in the window
+    '''
+
+    def __init__(self, length):
+        if length < 1: raise ValueError(f'Window length has to be at least 1: {length}')
+        self.length = length
+        self._values = array('d', [0.0] * length)
+        self._next = 0      #index of the slot that is overwritten next
+        self._count = 0     #number of valid values (<= length)
+        self._sum = 0.0
+
+    def push(self, value):
+        '''Add a value and drop the oldest one if the window is full'''
+        self._sum += value - self._values[self._next]
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.length
+        self._count = min(self._count + 1, self.length)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def full(self):
+        return self._count == self.length
+
+    @property
+    def sum(self):
+        return self._sum
+
+    @property
+    def mean(self):
+        return self._sum / self._count if self._count else 0.0
+
+    def values(self):
+        '''Returns the values of the window from oldest to newest'''
+        start = self._next if self.full else 0
+        return [self._values[(start + i) % self.length] for i in range(self._count)]
+
+
+class RunningMoments(object):
+    '''Streaming count, mean and variance (Welford)'''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def push(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+
+class InfectionLedger(object):
+    '''Append-only record of infection events with incremental transmission statistics
+        Every event is stored in typed arrays (time, infector, infectee, location).
+        All estimators are updated in O(1) per event, no history is re-read.
+
+        Events:
+            record_infection: infectee got infected by infector (infector NO_INFECTOR for seeded cases)
+                an infectee that is still infectious raises ValueError
+            record_removal: case stops being infectious (recovered or died); its
+                number of secondary cases is final from now on
+
+        Estimators:
+            secondary_cases(id): Number of secondary cases caused by case id so far (kept after removal)
+            offspring_distribution(): Number of cases with 0, 1, 2, ... secondary cases
+            case_reproduction_number(): Mean number of secondary cases of removed cases
+            generation_interval: Moments of the time between infection of infector and infectee
+            window(length): Rolling window over the generation intervals of the last events
+
+        Args:
+            windows (int, ...): Lengths of rolling windows over generation intervals
+    '''
+
+    NO_INFECTOR = -1
+
+    def __init__(self, windows=()):
+        #event columns
+        self.time = array('d')
+        self.infector = array('q')
+        self.infectee = array('q')
+        self.location_x = array('d')
+        self.location_y = array('d')
+
+        #per case state
+        self._infection_time = {}   #case id -> time of infection
+        self._secondary = {}        #case id -> number of secondary cases (only active cases)
+        self._final_secondary = {}  #case id -> number of secondary cases (removed cases)
+        self._offspring = array('q', [0])   #index k: number of cases with k secondary cases
+
+        #aggregates
+        self.num_removed = 0
+        self._removed_secondary = 0
+        self.generation_interval = RunningMoments()
+        self._windows = {length: RollingWindow(length) for length in windows}
+
+    def __len__(self):
+        return len(self.time)
+
+    def record_infection(self, time, infectee, infector=NO_INFECTOR, location=(0, 0)):
+        '''Append an infection event and update all estimators'''
+        if infectee in self._secondary:
+            raise ValueError(f'Case {infectee} is already infectious')
+        self.time.append(time)
+        self.infector.append(infector)
+        self.infectee.append(infectee)
+        self.location_x.append(location[0])
+        self.location_y.append(location[1])
+
+        self._infection_time[infectee] = time
+        self._secondary[infectee] = 0
+        self._offspring[0] += 1
+
+        if infector == self.NO_INFECTOR:
+            return
+
+        #move the infector one bin up in the offspring distribution
+        k = self._secondary.get(infector)
+        if k is None:
+            #infector is not known (seeded outside the ledger or already removed)
+            return
+        self._secondary[infector] = k + 1
+        self._offspring[k] -= 1
+        if k + 1 == len(self._offspring):
+            self._offspring.append(0)
+        self._offspring[k + 1] += 1
+
+        interval = time - self._infection_time[infector]
+        self.generation_interval.push(interval)
+        for window in self._windows.values():
+            window.push(interval)
+
+    def record_removal(self, case):
+        '''Mark a case as no longer infectious, its secondary cases are final'''
+        k = self._secondary.pop(case, None)
+        if k is None:
+            return
+        self._infection_time.pop(case, None)
+        self._final_secondary[case] = k
+        self.num_removed += 1
+        self._removed_secondary += k
+
+    def secondary_cases(self, case):
+        if case in self._secondary:
+            return self._secondary[case]
+        return self._final_secondary.get(case, 0)
+
+    def offspring_distribution(self):
+        '''Returns the number of cases with 0, 1, 2, ... secondary cases'''
+        return list(self._offspring)
+
+    def case_reproduction_number(self):
+        '''Mean number of secondary cases over all removed cases (exact, no estimation)'''
+        return self._removed_secondary / self.num_removed if self.num_removed else 0.0
+
+    @property
+    def num_active(self):
+        return len(self._secondary)
+
+    def window(self, length):
+        '''Returns the rolling window of the given length over generation intervals'''
+        if length not in self._windows:
+            raise KeyError(f'No rolling window of length {length}; pass it to InfectionLedger(windows=...)')
+        return self._windows[length]
+
+    def as_arrays(self):
+        '''Returns a copy of the ledger columns as numpy arrays
+            (a zero-copy view would lock the typed arrays against further appends)'''
+        return {
+            'time': np.array(self.time, dtype=np.float64),
+            'infector': np.array(self.infector, dtype=np.int64),
+            'infectee': np.array(self.infectee, dtype=np.int64),
+            'location_x': np.array(self.location_x, dtype=np.float64),
+            'location_y': np.array(self.location_y, dtype=np.float64),
+        }
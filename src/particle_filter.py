@@ -0,0 +1,221 @@
+import math
+import numpy as np
+
+from sim_epidemic import PARAMETERS, competing_exits, parameter_arrays
+
+COMPARTMENTS = ('S', 'I', 'R', 'Xs', 'Xi', 'Dn', 'Di')
+
+
+def sirxd_stochastic_step(state, params, rng, dt=1.0):
+    """Advance all particles one step of the SIRXD model with binomial transitions
+
+    The flows are the same as in sim_epidemic.sirxd_update_population,
+    but drawn as integer numbers of individuals for every particle at once.
+
+    Args:
+        state (ndarray): Compartments of shape (n_particles, 7), ordered as COMPARTMENTS
+        params (dict): Parameter name -> ndarray of shape (n_particles,), names as PARAMETERS
+        rng (numpy.random.Generator): Random number generator
+        dt (float): Duration of time step
+
+    Returns:
+        (ndarray, ndarray, ndarray):
+        Returns updated state, new quarantined infectious (confirmed cases) and new deceased infectious
+    """
+    S, I, R, Xs, Xi, Dn, Di = state.T
+    β, γ, δ, ωs, ωi, ωe, v, μ = (params[name] for name in PARAMETERS)
+    N = S + I + R + Xs + Xi
+    force = np.divide(β * I, N, out=np.zeros_like(β), where=N > 0)
+
+    S_I, S_Xs, S_Dn = competing_exits(rng, S, [force, ωs, μ], dt)
+    I_R, I_Xi, I_Di, I_Dn = competing_exits(rng, I, [γ, ωs + ωi, δ, μ], dt)
+    R_Dn, = competing_exits(rng, R, [μ], dt)
+    Xs_S, Xs_Dn = competing_exits(rng, Xs, [ωe, μ], dt)
+    Xi_R, Xi_Di, Xi_Dn = competing_exits(rng, Xi, [γ, δ, μ], dt)
+    births = rng.poisson(v * N * dt)
+
+    new = np.empty_like(state)
+    new[:, 0] = S - S_I - S_Xs - S_Dn + Xs_S + births
+    new[:, 1] = I - I_R - I_Xi - I_Di - I_Dn + S_I
+    new[:, 2] = R - R_Dn + I_R + Xi_R
+    new[:, 3] = Xs - Xs_S - Xs_Dn + S_Xs
+    new[:, 4] = Xi - Xi_R - Xi_Di - Xi_Dn + I_Xi
+    new[:, 5] = Dn + S_Dn + I_Dn + R_Dn + Xs_Dn + Xi_Dn
+    new[:, 6] = Di + I_Di + Xi_Di
+    return new, I_Xi, I_Di + Xi_Di
+
+
+def _log_likelihood(observed, expected, dispersion):
+    '''Log-probability of an observed count, including all normalizing terms
+        Negative binomial with the given dispersion, Poisson if dispersion is None;
+        the mean is the expected count + 0.5, so particles without any event don't give log(0)'''
+    expected = expected + 0.5
+    if dispersion is None:
+        return observed * np.log(expected) - expected - math.lgamma(observed + 1)
+    return math.lgamma(observed + dispersion) - math.lgamma(dispersion) - math.lgamma(observed + 1) + \
+        dispersion * np.log(dispersion / (dispersion + expected)) + \
+        observed * np.log(expected / (dispersion + expected))
+
+
+def systematic_resample(weights, rng):
+    '''Returns indices of the particles kept by systematic resampling'''
+    n = len(weights)
+    positions = (rng.random() + np.arange(n)) / n
+    cumulative = np.cumsum(weights)
+    cumulative[-1] = 1.0
+    return np.searchsorted(cumulative, positions)
+
+
+class ParticleFilter(object):
+    '''Sequential Monte-Carlo forecaster for the SIRXD model
+        Holds n_particles SIRXD states with their own parameters. Every update
+        advances all particles by one stochastic step, reweights them against
+        the observed counts of the day and resamples when the weights degenerate.
+
+        Args:
+            N (int): Population size
+            I (int): Number of infectious individuals at day 0
+            params (EpidemicParameters or dict): Parameters; dict values may be arrays
+                of length n_particles to start with a parameter prior
+            n_particles (int): Number of particles
+            jitter (dict): Parameter name -> std of the daily log-normal random walk,
+                lets the filter follow changing parameters (default: {'β': 0.05})
+            dispersion (float): Dispersion of the negative binomial observation model,
+                None for Poisson
+            resample_threshold (float): Resample when the effective sample size
+                drops below this fraction of n_particles
+            dt (float): Duration of a step; one update is one step
+            seed (int): Seed of the random number generator
+    '''
+
+    def __init__(self, N, I, params, n_particles=1000, jitter=None, dispersion=10.0,
+                 resample_threshold=0.5, dt=1.0, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.n_particles = n_particles
+        self.jitter = {'β': 0.05} if jitter is None else jitter
+        self.dispersion = dispersion
+        self.resample_threshold = resample_threshold
+        self.dt = dt
+
+        self.state = np.zeros((n_particles, len(COMPARTMENTS)), dtype=np.int64)
+        self.state[:, 0] = int(N) - int(I)
+        self.state[:, 1] = int(I)
+        self.params = parameter_arrays(params, (n_particles,))
+        self.log_weights = np.zeros(n_particles)
+
+        self.day = 0
+        self.log_evidence = 0.0     #log marginal likelihood of all observations so far (comparable between filters)
+        self.ess_data = []          #effective sample size after each update
+
+    @property
+    def weights(self):
+        w = np.exp(self.log_weights - self.log_weights.max())
+        return w / w.sum()
+
+    @property
+    def effective_sample_size(self):
+        w = self.weights
+        return 1.0 / np.sum(w**2)
+
+    def _perturb(self, params, rng):
+        for name, σ in self.jitter.items():
+            params[name] = params[name] * np.exp(σ * rng.standard_normal(len(params[name])))
+
+    def _resample(self):
+        index = systematic_resample(self.weights, self.rng)
+        self.state = self.state[index]
+        self.params = {name: value[index] for name, value in self.params.items()}
+        self.log_weights = np.zeros(self.n_particles)
+
+    def update(self, cases=None, deaths=None):
+        '''Advance all particles one day and assimilate the observations of this day
+
+        Args:
+            cases (int): New confirmed cases (inflow to Xi); None if not observed
+            deaths (int): New deceased infectious; None if not observed
+
+        Returns:
+            (dict): Weighted mean of each compartment after the update
+        '''
+        self._perturb(self.params, self.rng)
+        self.state, new_cases, new_deaths = sirxd_stochastic_step(self.state, self.params, self.rng, self.dt)
+        self.day += 1
+
+        increment = np.zeros(self.n_particles)
+        if cases is not None:
+            increment += _log_likelihood(cases, new_cases, self.dispersion)
+        if deaths is not None:
+            increment += _log_likelihood(deaths, new_deaths, self.dispersion)
+
+        #incremental evidence with the weights before this observation
+        w = self.weights
+        shift = increment.max()
+        self.log_evidence += shift + np.log(np.sum(w * np.exp(increment - shift)))
+        self.log_weights = self.log_weights + increment
+
+        if self.effective_sample_size < self.resample_threshold * self.n_particles:
+            self._resample()
+        self.ess_data.append(self.effective_sample_size)
+        return self.mean()
+
+    def mean(self):
+        '''Returns the weighted mean of each compartment and parameter'''
+        w = self.weights
+        result = {name: float(w @ self.state[:, i]) for i, name in enumerate(COMPARTMENTS)}
+        result.update({name: float(w @ value) for name, value in self.params.items()})
+        return result
+
+    def forecast(self, days, quantiles=(0.05, 0.5, 0.95), seed=None):
+        '''Simulate all particles days steps ahead without changing the filter
+
+        Args:
+            days (int): Forecast horizon in steps
+            quantiles (float, ...): Quantiles of the forecast intervals
+            seed (int): Seed for the forecast; None uses a new child of the filter's
+                seed sequence, so the filter's own generator is not advanced
+
+        Returns:
+            (dict): Name -> ndarray of shape (len(quantiles), days) for every
+            compartment and for 'cases' and 'deaths' (new per day)
+        '''
+        if seed is None:
+            seed = self.rng.bit_generator.seed_seq.spawn(1)[0]
+        rng = np.random.default_rng(seed)
+        index = systematic_resample(self.weights, rng)
+        state = self.state[index]
+        params = {name: value[index] for name, value in self.params.items()}
+
+        paths = np.empty((days, self.n_particles, len(COMPARTMENTS) + 2), dtype=np.int64)
+        for day in range(days):
+            self._perturb(params, rng)
+            state, new_cases, new_deaths = sirxd_stochastic_step(state, params, rng, self.dt)
+            paths[day, :, :len(COMPARTMENTS)] = state
+            paths[day, :, -2] = new_cases
+            paths[day, :, -1] = new_deaths
+
+        bands = np.quantile(paths, quantiles, axis=1)
+        names = COMPARTMENTS + ('cases', 'deaths')
+        return {name: bands[:, :, i] for i, name in enumerate(names)}
+
+
+if __name__ == "__main__":
+
+    # synthetic outbreak as observations
+    truth = ParticleFilter(N=100000, I=10, n_particles=1, jitter={}, seed=1,
+        params={'β': 0.3, 'γ': 0.1, 'δ': 0.005, 'ωi': 0.05})
+    observed = []
+    for _ in range(60):
+        truth.state, cases, _ = sirxd_stochastic_step(truth.state, truth.params, truth.rng)
+        observed.append(int(cases[0]))
+
+    # filter with unknown infection rate
+    pf = ParticleFilter(N=100000, I=10, n_particles=2000, seed=2,
+        params={'β': np.random.default_rng(3).uniform(0.1, 0.6, 2000), 'γ': 0.1, 'δ': 0.005, 'ωi': 0.05})
+    for day, cases in enumerate(observed[:40], start=1):
+        estimate = pf.update(cases=cases)
+        print(f"Day {day}: cases {cases}, β ≈ {estimate['β']:.3f}, ESS {pf.ess_data[-1]:.0f}")
+
+    forecast = pf.forecast(20)
+    print("Forecast of new cases (5%, 50%, 95%):")
+    for day in range(20):
+        print(40 + day + 1, forecast['cases'][:, day], observed[40 + day])
@@ -0,0 +1,159 @@
+import numpy as np
+import matplotlib.pyplot as plt
+
+MAX_POINTS = 2000 #Default number of points per plotted line; about two per horizontal pixel
+
+
+def minmax_indices(y, n_buckets):
+    '''Returns sorted indices of the minimum and maximum of y in each of n_buckets
+        equally sized buckets, plus the first and last index. Keeps every peak and
+        dip visible at screen resolution.'''
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+    size = -(-n // n_buckets) #ceil
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, size)
+    valid = ~np.all(np.isnan(buckets), axis=1)
+    offsets = np.arange(n_buckets)[valid] * size
+    filled = np.where(np.isnan(buckets[valid]), np.inf, buckets[valid])
+    low = offsets + np.argmin(filled, axis=1)
+    filled = np.where(np.isnan(buckets[valid]), -np.inf, buckets[valid])
+    high = offsets + np.argmax(filled, axis=1)
+    return np.unique(np.concatenate(([0, n - 1], low, high)))
+
+
+def lttb_indices(x, y, n_out):
+    '''Returns indices selected by Largest-Triangle-Three-Buckets downsampling
+        Keeps the visual shape of a line with n_out points (first and last included).'''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        #average of the next bucket (last point for the final bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        next_end = max(next_end, next_start + 1)
+        cx, cy = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        area = np.abs((x[a] - cx) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (cy - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def decimate(x, y, max_points=MAX_POINTS, method='minmax'):
+    '''Returns x, y reduced to about max_points points
+
+    Args:
+        x, y (array-like): Data of one line
+        max_points (int): Target number of points; None disables decimation
+        method (str): 'minmax' (min and max per bucket, exact envelope) or 'lttb'
+
+    Returns:
+        (ndarray, ndarray): Decimated x and y
+    '''
+    x, y = np.asarray(x), np.asarray(y)
+    if max_points is None or len(y) <= max_points:
+        return x, y
+    if method == 'minmax':
+        index = minmax_indices(y, max(1, max_points // 2))
+    elif method == 'lttb':
+        index = lttb_indices(x, y, max_points)
+    else:
+        raise ValueError(f'Unknown decimation method: {method}')
+    return x[index], y[index]
+
+
+def decimate_many(x, ys, max_points=MAX_POINTS):
+    '''Decimates several lines on a shared x axis (e.g. for stackplot or ribbons)
+        using the union of the min/max indices of all lines.
+
+    Returns:
+        (ndarray, list of ndarray): Decimated x and lines
+    '''
+    x = np.asarray(x)
+    ys = [np.asarray(y) for y in ys]
+    if max_points is None or len(x) <= max_points:
+        return x, ys
+    n_buckets = max(1, max_points // (2 * len(ys)))
+    index = np.unique(np.concatenate([minmax_indices(y, n_buckets) for y in ys]))
+    return x[index], [y[index] for y in ys]
+
+
+def align_runs(runs, fill='last'):
+    '''Stacks runs of different lengths into one array of shape (n_runs, max_length)
+
+    Args:
+        runs (list of array-like): Time series of each run, all sampled from time 0
+        fill (str): 'last' repeats the final value of a shorter run (the run ended in
+            that state, e.g. extinction), 'nan' leaves the missing steps out of statistics
+
+    Returns:
+        (ndarray): Aligned runs
+    '''
+    length = max(len(run) for run in runs)
+    aligned = np.full((len(runs), length), np.nan)
+    for i, run in enumerate(runs):
+        run = np.asarray(run, dtype=np.float64)
+        aligned[i, :len(run)] = run
+        if fill == 'last' and len(run):
+            aligned[i, len(run):] = run[-1]
+    return aligned
+
+
+def quantile_ribbon(runs, time=None, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), ax=None,
+                    color=None, label=None, fill='last', max_points=MAX_POINTS):
+    '''Plots an ensemble as median line with shaded quantile bands instead of one line per run
+
+    Args:
+        runs (list of array-like): Time series of each run, may differ in length
+        time (array-like): Time of each step, at least as long as the longest run;
+            defaults to the step index
+        quantiles (float, ...): Symmetric quantiles, the middle one is drawn as line
+        ax (Axes): Target axes; defaults to the current axes
+        color: Color of line and bands
+        label (str): Legend label of the median line
+        fill (str): How to extend shorter runs, see align_runs
+        max_points (int): Decimation target per band
+
+    Returns:
+        (Line2D): The median line
+    '''
+    ax = ax if ax else plt.gca()
+    aligned = align_runs(runs, fill=fill)
+    if time is None:
+        time = np.arange(aligned.shape[1])
+    elif len(time) < aligned.shape[1]:
+        raise ValueError(f'time has {len(time)} steps, the longest run has {aligned.shape[1]}')
+    else:
+        time = np.asarray(time)[:aligned.shape[1]]
+
+    #only fill='nan' leaves gaps; the nan* functions are much slower, so avoid them otherwise
+    if fill == 'nan':
+        mean, low, high, quantile = np.nanmean, np.nanmin, np.nanmax, np.nanquantile
+    else:
+        mean, low, high, quantile = np.mean, np.min, np.max, np.quantile
+
+    #pick the plotted steps first from cheap envelopes, then compute quantiles only there
+    if max_points is not None and len(time) > max_points:
+        envelopes = (mean(aligned, axis=0), low(aligned, axis=0), high(aligned, axis=0))
+        n_buckets = max(1, max_points // (2 * len(envelopes)))
+        index = np.unique(np.concatenate([minmax_indices(e, n_buckets) for e in envelopes]))
+        time, aligned = time[index], aligned[:, index]
+    bands = quantile(aligned, quantiles, axis=0)
+
+    middle = len(quantiles) // 2
+    line, = ax.plot(time, bands[middle], color=color, label=label)
+    for i in range(middle):
+        alpha = 0.15 + 0.25 * i / max(1, middle)
+        ax.fill_between(time, bands[i], bands[-(i + 1)], color=line.get_color(), alpha=alpha, linewidth=0)
+    return line
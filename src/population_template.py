@@ -0,0 +1,101 @@
+import os
+import numpy as np
+from multiprocessing import shared_memory
+
+#Per agent attributes of a template; all 8 byte wide
+FIELDS = (
+    ('name', np.int64),
+    ('home_x', np.int64),
+    ('home_y', np.int64),
+    ('lifespan', np.float64),
+    ('recover_time', np.float64),
+)
+_HEADER = 8 #bytes in front of the shared memory block holding the number of agents
+
+
+class PopulationTemplate(object):
+    '''Initial attributes of a whole population in one array per attribute
+        A template is generated once (vectorized) and reused by every replicate:
+        saved to .npy files it is opened memory-mapped and copy-on-write, placed in
+        shared memory it is attached by worker processes without copying.
+
+        Attributes (ndarray, one value per agent):
+            name, home_x, home_y, lifespan, recover_time
+    '''
+
+    def __init__(self, arrays, shm=None):
+        self.arrays = arrays
+        self._shm = shm
+        for field, _ in FIELDS:
+            setattr(self, field, arrays[field])
+
+    def __len__(self):
+        return len(self.name)
+
+    @classmethod
+    def generate(cls, num_people, first_name=1):
+        '''Draws the attributes of num_people agents at once from their streams
+            (stochastic_sim_epidemic.agent_attribute_arrays), so a template holds the same
+            agents as create_people with the same run_seed'''
+        from stochastic_sim_epidemic import agent_attribute_arrays #imports this module
+        names = np.arange(first_name, first_name + num_people, dtype=np.int64)
+        return cls({'name': names, **agent_attribute_arrays(names)})
+
+    def save(self, path):
+        '''Saves the template as one .npy file per attribute in directory path'''
+        os.makedirs(path, exist_ok=True)
+        for field, _ in FIELDS:
+            np.save(os.path.join(path, f'{field}.npy'), self.arrays[field])
+
+    @classmethod
+    def load(cls, path, mmap_mode='c'):
+        '''Opens a saved template memory-mapped; with mmap_mode 'c' (copy-on-write) pages
+            are only read when used and changes stay private to this process'''
+        return cls({field: np.load(os.path.join(path, f'{field}.npy'), mmap_mode=mmap_mode) for field, _ in FIELDS})
+
+    def to_shared_memory(self, name=None):
+        '''Copies the template into a new shared memory block
+
+        Returns:
+            (PopulationTemplate): Template backed by the block; pass its shm_name to attach
+        '''
+        n = len(self)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=_HEADER + 8 * n * len(FIELDS))
+        np.ndarray(1, dtype=np.int64, buffer=shm.buf)[0] = n
+        template = type(self)(_shared_arrays(shm, n), shm=shm)
+        for field, _ in FIELDS:
+            template.arrays[field][:] = self.arrays[field]
+        return template
+
+    @classmethod
+    def attach(cls, name):
+        '''Attaches to a template in shared memory without copying (read-only views)'''
+        shm = shared_memory.SharedMemory(name=name)
+        n = int(np.ndarray(1, dtype=np.int64, buffer=shm.buf)[0])
+        arrays = _shared_arrays(shm, n)
+        for array in arrays.values():
+            array.flags.writeable = False
+        return cls(arrays, shm=shm)
+
+    @property
+    def shm_name(self):
+        return self._shm.name if self._shm else None
+
+    def close(self, unlink=False):
+        '''Releases the shared memory block; unlink=True also frees it (creator only)'''
+        if not self._shm:
+            return
+        self.arrays = {}
+        for field, _ in FIELDS:
+            setattr(self, field, None)
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+        self._shm = None
+
+
+def _shared_arrays(shm, n):
+    arrays = {}
+    for i, (field, dtype) in enumerate(FIELDS):
+        arrays[field] = np.ndarray(n, dtype=dtype, buffer=shm.buf, offset=_HEADER + 8 * n * i)
+    return arrays
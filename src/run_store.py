@@ -0,0 +1,279 @@
+import os
+import json
+import tempfile
+import numpy as np
+
+META_FILE = 'meta.json'
+INDEX_FILE = 'index.npz'
+INFECTED_COLUMNS = ('I', 'Xi') #columns counted for the extinction time
+CHUNK_SIZE = 1024 #time steps read per chunk in time-wise aggregations
+
+#corona.Population attribute of each stored column
+POPULATION_COLUMNS = {
+    'S': 's_class_data', 'I': 'i_class_data', 'R': 'r_class_data',
+    'Xs': 'xs_class_data', 'Xi': 'xi_class_data', 'Dn': 'dn_class_data',
+    'Di': 'di_class_data', 'N': 'n_class_data',
+}
+
+
+def save_run(root, run_id, columns, metadata=None):
+    '''Stores one run as <root>/<run_id>/<column>.npy plus its metadata in meta.json
+        meta.json is written last; RunStore.index compares its modification time and size
+        with the ones stored in the index to find new or overwritten runs.
+
+    Args:
+        root (str): Directory of all runs
+        run_id (str): Name of the run
+        columns (dict): Column name -> time series; an optional column 'T' holds the time
+        metadata (dict): JSON serializable scenario description (e.g. region, parameters)
+    '''
+    path = os.path.join(root, str(run_id))
+    os.makedirs(path, exist_ok=True)
+    length = 0
+    for name, values in columns.items():
+        values = np.asarray(values, dtype=np.float64)
+        np.save(os.path.join(path, f'{name}.npy'), values)
+        length = max(length, len(values))
+    meta = {'columns': list(columns), 'length': length, 'metadata': metadata or {}}
+    with open(os.path.join(path, META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+
+def save_population(root, population, run_id=None, metadata=None):
+    '''Stores the simulation results of a corona.Population (run_id defaults to its name)'''
+    columns = {name: getattr(population, attribute) for name, attribute in POPULATION_COLUMNS.items()}
+    save_run(root, run_id if run_id is not None else population.name, columns, metadata)
+
+
+def _matches(value, criterion):
+    if callable(criterion):
+        return criterion(value)
+    if isinstance(criterion, (list, tuple, set)):
+        return value in criterion
+    return value == criterion
+
+
+class RunStore(object):
+    '''Lazy view on a directory of stored runs
+        Only metadata is read when opening; columns are memory-mapped when needed,
+        and per-run summaries (peak, time of peak, final value, extinction time) are
+        kept in a small index so common queries don't touch the raw data.
+
+        Args:
+            root (str): Directory written by save_run
+    '''
+
+    def __init__(self, root):
+        self.root = root
+        self.runs = sorted(entry.name for entry in os.scandir(root)
+            if entry.is_dir() and os.path.exists(os.path.join(entry.path, META_FILE)))
+        self._meta = {}
+        self._index = None
+
+    def meta(self, run_id):
+        if run_id not in self._meta:
+            with open(os.path.join(self.root, run_id, META_FILE)) as f:
+                self._meta[run_id] = json.load(f)
+        return self._meta[run_id]
+
+    def metadata(self, run_id):
+        return self.meta(run_id)['metadata']
+
+    def column(self, run_id, name):
+        '''Returns a read-only memory map of a column of the run'''
+        return np.load(os.path.join(self.root, run_id, f'{name}.npy'), mmap_mode='r')
+
+    def select(self, predicate=None, **criteria):
+        '''Returns the runs whose metadata match
+
+        Args:
+            predicate (callable): metadata dict -> bool
+            criteria: metadata key -> value, collection of allowed values or callable
+        '''
+        return RunSelection(self, self.runs).select(predicate, **criteria)
+
+    def all(self):
+        return RunSelection(self, self.runs)
+
+    def meta_stamps(self):
+        '''Returns (modification time in ns, size) of the meta.json of every run, shape (runs, 2)'''
+        stamps = np.zeros((len(self.runs), 2), dtype=np.int64)
+        for k, run in enumerate(self.runs):
+            stat = os.stat(os.path.join(self.root, run, META_FILE))
+            stamps[k] = stat.st_mtime_ns, stat.st_size
+        return stamps
+
+    def index(self, rebuild=False):
+        '''Returns the summary index, building and saving it if it is missing or outdated
+            The stored index is outdated if the runs or the stamps of their meta.json differ;
+            once loaded, the index is kept for the lifetime of this RunStore.
+
+        Returns:
+            (dict): 'run' -> run ids; 'meta_stamp' -> see meta_stamps;
+            '<column>.peak', '<column>.peak_time', '<column>.final' -> value per run
+            (NaN if the run lacks the column);
+            'extinction_time' -> first time with I + Xi < 1 (NaN if never)
+        '''
+        if self._index is not None and not rebuild:
+            return self._index
+        path = os.path.join(self.root, INDEX_FILE)
+        if not rebuild and os.path.exists(path):
+            with np.load(path) as stored:
+                index = dict(stored)
+            if index['run'].tolist() == self.runs and 'meta_stamp' in index \
+                    and np.array_equal(index['meta_stamp'], self.meta_stamps()):
+                self._index = index
+                return index
+        self._index = self._build_index()
+        #written to a temporary file first, so readers never load a partial index
+        fd, temporary = tempfile.mkstemp(dir=self.root, suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **self._index)
+        os.replace(temporary, path)
+        return self._index
+
+    def _build_index(self):
+        #stamps are taken before reading, so a run overwritten meanwhile is outdated on the next load
+        stamps = self.meta_stamps()
+        self._meta = {}
+        columns = sorted({name for run in self.runs for name in self.meta(run)['columns']} - {'T'})
+        index = {'run': np.array(self.runs), 'meta_stamp': stamps}
+        for name in columns:
+            for stat in ('peak', 'peak_time', 'final'):
+                index[f'{name}.{stat}'] = np.full(len(self.runs), np.nan)
+        index['extinction_time'] = np.full(len(self.runs), np.nan)
+
+        for k, run in enumerate(self.runs):
+            names = self.meta(run)['columns']
+            time = self.column(run, 'T') if 'T' in names else None
+            infected = None
+            for name in names:
+                if name == 'T':
+                    continue
+                values = self.column(run, name)
+                if not len(values):
+                    continue
+                peak = int(np.argmax(values))
+                index[f'{name}.peak'][k] = values[peak]
+                index[f'{name}.peak_time'][k] = time[peak] if time is not None else peak
+                index[f'{name}.final'][k] = values[-1]
+                if name in INFECTED_COLUMNS:
+                    infected = np.array(values) if infected is None else infected + values
+            if infected is not None:
+                extinct = np.flatnonzero(infected[1:] < 1)
+                if len(extinct):
+                    step = extinct[0] + 1
+                    index['extinction_time'][k] = time[step] if time is not None else step
+        return index
+
+
+class RunSelection(object):
+    '''Subset of the runs of a RunStore with aggregations over them'''
+
+    def __init__(self, store, runs):
+        self.store = store
+        self.runs = list(runs)
+
+    def __len__(self):
+        return len(self.runs)
+
+    def select(self, predicate=None, **criteria):
+        '''Narrows the selection, see RunStore.select'''
+        runs = []
+        for run in self.runs:
+            metadata = self.store.metadata(run)
+            if predicate and not predicate(metadata):
+                continue
+            if all(key in metadata and _matches(metadata[key], criterion) for key, criterion in criteria.items()):
+                runs.append(run)
+        return RunSelection(self.store, runs)
+
+    def summary(self, key):
+        '''Returns an index entry (e.g. 'Xi.peak', 'Di.final', 'extinction_time') for each run'''
+        index = self.store.index()
+        position = {run: k for k, run in enumerate(index['run'].tolist())}
+        return index[key][[position[run] for run in self.runs]]
+
+    def group_by(self, metadata_key, key, reducer=np.nanmax):
+        '''Reduces an index entry per value of a metadata key,
+            e.g. group_by('region', 'Xi.peak') -> peak Xi per region over all runs'''
+        values = self.summary(key)
+        groups = {}
+        for run, value in zip(self.runs, values):
+            groups.setdefault(self.store.metadata(run).get(metadata_key), []).append(value)
+        return {group: reducer(np.array(v)) for group, v in groups.items()}
+
+    def reduce(self, column, how='sum', chunk_size=CHUNK_SIZE * 64):
+        '''Reduces a column over the whole run of every run, reading chunk by chunk
+
+        Args:
+            column (str): Column name
+            how (str): 'sum', 'mean', 'min' or 'max'
+
+        Returns:
+            (ndarray): One value per run (NaN if the run is empty)
+        '''
+        result = np.full(len(self.runs), np.nan)
+        for k, run in enumerate(self.runs):
+            values = self.store.column(run, column)
+            if not len(values):
+                continue
+            acc = None
+            for start in range(0, len(values), chunk_size):
+                chunk = np.asarray(values[start:start + chunk_size])
+                if how in ('sum', 'mean'):
+                    part = chunk.sum()
+                    acc = part if acc is None else acc + part
+                elif how == 'min':
+                    acc = chunk.min() if acc is None else min(acc, chunk.min())
+                elif how == 'max':
+                    acc = chunk.max() if acc is None else max(acc, chunk.max())
+                else:
+                    raise ValueError(f'Unknown reduction: {how}')
+            result[k] = acc / len(values) if how == 'mean' else acc
+        return result
+
+    def quantiles_by_time(self, column, quantiles=(0.05, 0.5, 0.95), fill='last', chunk_size=CHUNK_SIZE):
+        '''Quantiles of a column over all runs for every time step, computed chunk by chunk in time
+
+        Args:
+            column (str): Column name
+            quantiles (float, ...): Quantiles to compute
+            fill (str): 'last' repeats the final value of shorter runs (empty runs are skipped),
+                'nan' ignores them
+            chunk_size (int): Time steps per chunk; memory use is runs x chunk_size
+
+        Returns:
+            (ndarray): Shape (len(quantiles), longest run)
+        '''
+        #one pass for lengths and final values, then chunk by chunk; a run is kept open
+        #only while it is read, so the number of runs isn't limited by open files
+        lengths, finals = np.zeros(len(self.runs), dtype=np.int64), np.full(len(self.runs), np.nan)
+        for k, run in enumerate(self.runs):
+            values = self.store.column(run, column)
+            lengths[k] = len(values)
+            if len(values):
+                finals[k] = values[-1]
+            del values
+        #only fill='nan' leaves gaps; np.nanquantile is much slower, so avoid it otherwise
+        if fill == 'nan':
+            runs, quantile = np.arange(len(self.runs)), np.nanquantile
+        else:
+            runs, quantile = np.flatnonzero(lengths), np.quantile #empty runs have no final value to repeat
+        length = int(lengths.max(initial=0))
+        result = np.full((len(quantiles), length), np.nan)
+        for start in range(0, length, chunk_size):
+            end = min(start + chunk_size, length)
+            block = np.full((len(runs), end - start), np.nan)
+            for k, r in enumerate(runs.tolist()):
+                if lengths[r] > start:
+                    values = self.store.column(self.runs[r], column)
+                    block[k, :min(lengths[r], end) - start] = values[start:end]
+                    del values
+                if fill == 'last' and lengths[r] < end:
+                    block[k, max(lengths[r] - start, 0):] = finals[r]
+            result[:, start:end] = quantile(block, quantiles, axis=0)
+        return result
+
+    def median_by_time(self, column, **kwargs):
+        return self.quantiles_by_time(column, quantiles=(0.5,), **kwargs)[0]
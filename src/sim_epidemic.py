@@ -1,6 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
 
+from plot_tools import MAX_POINTS, decimate, quantile_ribbon
+
 
 # Calculate Changes in S,I,R,X,D groups
 def sirxd_update_population(S, I, R, Xs, Xi, Dn, Di, β, γ, δ, κs, κi, κe, v=0.0, μ=0.0, dt=1.0):
@@ -92,6 +94,52 @@ def sirxd_update_population(S, I, R, Xs, Xi, Dn, Di, β, γ, δ, κs, κi, κe,
 def sirxd_update_groups(groups, rates, dt=1.0):
     return sirxd_update_population(*groups, *rates, dt)
 
+PARAMETERS = ('β', 'γ', 'δ', 'ωs', 'ωi', 'ωe', 'v', 'μ') #names of the SIRXD rates
+
+def parameter_arrays(params, shape=None):
+    '''Returns parameter name -> float ndarray, all broadcast to the same shape
+
+    Args:
+        params: EpidemicParameters, a list of EpidemicParameters or
+            a dict of scalars/arrays with the names of PARAMETERS (missing names are 0)
+        shape (tuple): Shape of the arrays, which are then writable copies
+            (default: the broadcast shape of the values, as read-only views)
+    '''
+    if isinstance(params, dict):
+        values = [params.get(name) for name in PARAMETERS]
+    elif isinstance(params, (list, tuple)):
+        values = [[getattr(p, name, None) or 0.0 for p in params] for name in PARAMETERS]
+    else:
+        values = [getattr(params, name, None) for name in PARAMETERS]
+    values = [np.asarray(0.0 if value is None else value, dtype=np.float64) for value in values]
+    if shape is not None:
+        return {name: np.broadcast_to(value, shape).copy() for name, value in zip(PARAMETERS, values)}
+    return dict(zip(PARAMETERS, np.broadcast_arrays(*values)))
+
+def competing_exits(rng, n, rates, dt):
+    '''Split n individuals on competing exits with the given rates (chain binomial)
+
+    Args:
+        n (int or ndarray): Number of individuals (e.g. per particle)
+        rates (list of float or ndarray): Exit rate per destination
+        dt (float): Duration of time step
+
+    Returns:
+        (list of int or ndarray): Number of individuals leaving to each destination
+    '''
+    total = sum(rates)
+    leaving = rng.binomial(n, -np.expm1(-total * dt))
+    exits = []
+    remaining_rate = total
+    for rate in rates[:-1]:
+        p = np.divide(rate, remaining_rate, out=np.zeros_like(total), where=remaining_rate > 0)
+        k = rng.binomial(leaving, np.clip(p, 0.0, 1.0))
+        exits.append(k)
+        leaving = leaving - k
+        remaining_rate = remaining_rate - rate
+    exits.append(leaving)
+    return exits
+
 # Simulate epidemic using SIRXD model and constant rates
 def sim_epidemic_sirxd(N, I, T, rates, time_step=1.0, adapt_birthrate=True):
 
@@ -131,34 +179,49 @@ def sim_epidemic_sirxd(N, I, T, rates, time_step=1.0, adapt_birthrate=True):
     time = [0] + time
     sirxd_plot(time, S, I, R, Xs, Xi, Dn, Di, N)
 
-def sirxd_plot(time, S, I, R, Xs, Xi, Dn, Di, N, title=None, figure=1, last_figure=False):
-    """Plots the given SIRXD model given by it's groups/classes"""
+SIRXD_LABELS = (
+    "Susceptible", 
+    "Infectious", 
+    "Recovered", 
+    "Susceptible in quarantine", 
+    "Infectious in quarantine", 
+    "Naturally deceased", 
+    "Deceased infectious", 
+    "Total population")
+
+def sirxd_plot(time, S, I, R, Xs, Xi, Dn, Di, N, title=None, figure=1, last_figure=False, max_points=MAX_POINTS):
+    """Plots the given SIRXD model given by it's groups/classes
+        Each line is decimated to max_points (min/max per bucket) before drawing."""
     plt.figure(figure)
-    plt.plot(
-        time, S,
-        time, I,
-        time, R,
-        time, Xs,
-        time, Xi,
-        time, Dn,
-        time, Di,
-        time, N
-    )
+    for group in (S, I, R, Xs, Xi, Dn, Di, N):
+        plt.plot(*decimate(time, group, max_points))
     if title: plt.title(f'Population: {title}')
     plt.grid(True)
     plt.xlabel('Time')
     plt.ylabel('S,I,R,X,D')
     plt.xlim((0, time[-1]))# plt.xlim((0, T))
     plt.ylim((0, 1.5*N[0]))
-    plt.legend((
-        "Susceptible", 
-        "Infectious", 
-        "Recovered", 
-        "Susceptible in quarantine", 
-        "Infectious in quarantine", 
-        "Naturally deceased", 
-        "Deceased infectious", 
-        "Total population"))
+    plt.legend(SIRXD_LABELS)
+    if last_figure:
+        plt.show()
+
+def sirxd_plot_ensemble(runs, time=None, title=None, figure=1, last_figure=False, max_points=MAX_POINTS):
+    """Plots several runs of the SIRXD model as quantile ribbons per group
+
+    Args:
+        runs (list of tuple): (S, I, R, Xs, Xi, Dn, Di, N) of each run; runs may differ in length
+        time (array-like): Time of each step of the longest run; defaults to the step index
+    """
+    plt.figure(figure)
+    for i, label in enumerate(SIRXD_LABELS):
+        quantile_ribbon([run[i] for run in runs], time=time, label=label, max_points=max_points)
+    if title: plt.title(f'Populations: {title}')
+    plt.grid(True)
+    plt.xlabel('Time')
+    plt.ylabel('S,I,R,X,D')
+    plt.xlim(left=0)
+    plt.ylim((0, 1.5*max(run[7][0] for run in runs)))
+    plt.legend()
     if last_figure:
         plt.show()
 
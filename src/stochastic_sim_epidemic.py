@@ -1,12 +1,19 @@
+import gc
 import simpy
 import numpy as np
 import matplotlib.pyplot as plt
 from enum import Enum
-from random import random, randint, seed, choices, gauss
-
-# init random number generator 
+from contextlib import contextmanager
+from infection_ledger import InfectionLedger, RollingWindow
+from agent_random import AgentStreams
+from population_template import PopulationTemplate
+from run_store import save_run
+from plot_tools import decimate_many
+
+# every random draw of a run comes from the agent streams
 # to get reproducible results
-seed(42)
+run_seed = 42
+streams = AgentStreams(run_seed) # every agent draws from its own stream, keyed by (run_seed, name)
 
 # Print debugging output 
 debugging = False
@@ -15,11 +22,23 @@ def debug(*args, **kwargs):
     if debugging:
         print(*args, **kwargs)
 
-def randbool(probability):
-    return True if random() < probability else False
-
-def randlocation(x_min=0, x_max=50, y_min=0, y_max=50):
-    x, y = randint(x_min, x_max), randint(y_min, y_max)
+@contextmanager
+def gc_paused():
+    '''Pauses the cyclic garbage collector while many long-lived objects are created;
+        otherwise it scans the growing population again and again'''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def randbool(probability, rng):
+    return True if rng.random() < probability else False
+
+def randlocation(rng, x_min=0, x_max=50, y_min=0, y_max=50):
+    x, y = rng.randint(x_min, x_max), rng.randint(y_min, y_max)
     return (x, y)
 
 def distance_squared(location1, location2):
@@ -45,13 +64,18 @@ infection_probability = 0.1
 mu_infection_duration = 24 * 3
 sigma_infection_duration = 24 * 1
 # vaccination_probability = 0.4
+population_template = None # directory of a saved PopulationTemplate; None draws every agent on its own
+results_directory = None # directory of a RunStore to save the run in; None doesn't save
 sim_time = 1000
 groups_sample_time = 1
 stats_sample_time = 24
+stats_window = 1 # number of stats samples the rates are averaged over
 
 
 T, S, I, R = [], [], [], []
 β, λ, γ, R0, Reff = [0], [0], [0], [0], [0]
+Rc, Tg = [0], [0]
+ledger = InfectionLedger()
 def update_groups(env):
     global people
     global T, S, I, R 
@@ -84,37 +108,39 @@ def update_groups(env):
         yield env.timeout(groups_sample_time)
 
 def update_stats(env):
-    global num_people
-    global β, λ, γ, R0, Reff
-    global stats_sample_time
+    global num_people, ledger
+    global β, λ, γ, R0, Reff, Rc, Tg
+    global stats_sample_time, stats_window
+
+    # new infections and removals per stats sample, counted exactly by the ledger
+    infections, removals = RollingWindow(stats_window), RollingWindow(stats_window)
+    num_infections, num_removed = len(ledger), ledger.num_removed
 
     yield env.timeout(stats_sample_time)
     while True:
 
-        try:
-
-            debug("Updating Stats")
-            cS, cI, cR = S[-1], I[-1], R[-1]
-            dS, dI, dR = (cS - S[-(stats_sample_time+1)]), (cI - I[-(stats_sample_time+1)]), (cR - R[-(stats_sample_time+1)])
-
-            cλ = -dS / cS if cS else 0
-            cβ = cλ * num_people / cI if cI else 0
-            cγ = dR / cI if cI else 0
-            cR0 = cβ / cγ if cγ else 0
-            cReff = cR0 * cS / num_people
-
-            λ.append(cλ)
-            β.append(cβ)
-            γ.append(cγ)
-            R0.append(cR0)
-            Reff.append(cReff)
-
-
-            if cI == 0:
-                break
+        debug("Updating Stats")
+        infections.push(len(ledger) - num_infections)
+        removals.push(ledger.num_removed - num_removed)
+        num_infections, num_removed = len(ledger), ledger.num_removed
+        cS, cI = S[-1], I[-1]
+
+        cλ = infections.mean / cS if cS else 0
+        cβ = cλ * num_people / cI if cI else 0
+        cγ = removals.mean / cI if cI else 0
+        cR0 = cβ / cγ if cγ else 0
+        cReff = cR0 * cS / num_people
+
+        λ.append(cλ)
+        β.append(cβ)
+        γ.append(cγ)
+        R0.append(cR0)
+        Reff.append(cReff)
+        Rc.append(ledger.case_reproduction_number())
+        Tg.append(ledger.generation_interval.mean)
 
-        except IndexError:
-            pass
+        if cI == 0:
+            break
 
         yield env.timeout(stats_sample_time)
 
@@ -122,6 +148,40 @@ def num_infectious():
     global I
     return I[-1]
 
+# stream tags of the agent attributes
+HOME_TAG, DURATION_TAG = 1, 2
+
+def agent_attribute_arrays(names):
+    '''Draws home, lifespan and recovery time of the agents with the given names at once
+        from their streams (the same values no matter how many agents are drawn together)
+
+    Returns:
+        (dict): 'home_x', 'home_y', 'lifespan', 'recover_time' -> ndarray, one value per agent
+    '''
+    global mu_old_age, sigma_old_age, mu_infection_duration, sigma_infection_duration
+    homes = (streams.uniform(names, 2, HOME_TAG) * 51).astype(np.int64) # like randlocation(): 0 to 50
+    normal = streams.normal(names, 2, DURATION_TAG)
+    return {
+        'home_x': homes[:, 0],
+        'home_y': homes[:, 1],
+        'lifespan': mu_old_age + sigma_old_age * normal[:, 0],
+        'recover_time': np.maximum(mu_infection_duration + sigma_infection_duration * normal[:, 1], 24),
+    }
+
+def agent_attributes(names):
+    '''agent_attribute_arrays as lists of homes, lifespans and recovery times'''
+    arrays = agent_attribute_arrays(names)
+    homes = list(zip(arrays['home_x'].tolist(), arrays['home_y'].tolist()))
+    return homes, arrays['lifespan'].tolist(), arrays['recover_time'].tolist()
+
+def create_people(env, num):
+    '''Creates num new Person, drawing the attributes of all of them in one call'''
+    names = [Person.gen_name() for _ in range(num)]
+    homes, lifespans, recover_times = agent_attributes(names)
+    with gc_paused():
+        return [Person(env, name=name, home=home, lifespan=lifespan, recover_time=recover_time)
+            for name, home, lifespan, recover_time in zip(names, homes, lifespans, recover_times)]
+
 class Person(object):
 
     @classmethod
@@ -133,25 +193,25 @@ class Person(object):
         cls.people_counter += 1
         return cls.people_counter
 
-    @classmethod
-    def gen_home(cls):
-        return randlocation()
-
-    def __init__(self, env, name=None, home=None, state=SIR.susceptible):
-        global mu_old_age, sigma_old_age, mu_infection_duration, sigma_infection_duration
-
+    def __init__(self, env, name=None, home=None, state=SIR.susceptible, lifespan=None, recover_time=None):
         self.env = env
         self.name = name if name else self.gen_name()
-        self.home = home if home else self.gen_home()
+        self.rng = streams.stream(self.name)
+        if home is None or lifespan is None or recover_time is None:
+            homes, lifespans, recover_times = agent_attributes([self.name])
+            home = home if home is not None else homes[0]
+            lifespan = lifespan if lifespan is not None else lifespans[0]
+            recover_time = recover_time if recover_time is not None else recover_times[0]
+        self.home = home
         self.location = self.home
         self.is_outside = False
         
         self.birth_time = env.now
-        self.lifespan = gauss(mu_old_age, sigma_old_age)
+        self.lifespan = lifespan
 
         self.state = state
         self.infection_time = 0
-        self.recover_time = max(gauss(mu_infection_duration, sigma_infection_duration), 24)
+        self.recover_time = recover_time
 
         # self.in_quarantine = False
         # self.is_vaccinated = False
@@ -172,9 +232,9 @@ class Person(object):
             while True:
 
                 # Determine daily routine
-                sleep_time = randint(4, 8)
-                day_time = randint(4, 8)
-                is_going_outside = bool(random() <= 0.5)
+                sleep_time = self.rng.randint(4, 8)
+                day_time = self.rng.randint(4, 8)
+                is_going_outside = bool(self.rng.random() <= 0.5)
 
                 # aging
                 if self.age() >= self.lifespan:
@@ -187,7 +247,7 @@ class Person(object):
                 # go outside or stay at home
                 if is_going_outside:
                     # Go Outside
-                    outside_location = randlocation()
+                    outside_location = randlocation(self.rng)
                     yield self.env.process(self.go_outside(day_time, outside_location))
                 else:
                     # Stay Home
@@ -221,9 +281,10 @@ class Person(object):
                 if person.is_outside and person.state == SIR.infectious and \
                 distance_squared(self.location, person.location) <= infectious_distance_squared]
 
-            # if infectious people are nearby, get infected
-            if local_infectious and randbool(infection_probability):
-                self.get_infected()
+            # if infectious people are nearby, get infected by the closest one
+            if local_infectious and randbool(infection_probability, self.rng):
+                infector = min(local_infectious, key=lambda person: distance_squared(self.location, person.location))
+                self.get_infected(infector)
         # infecting others
         elif self.state == SIR.infectious:
             # find out if susceptible people are nearby
@@ -233,8 +294,8 @@ class Person(object):
 
             for person in local_susceptible:
                 # if infectious people are nearby, get infected
-                if randbool(infection_probability):
-                    person.get_infected()
+                if randbool(infection_probability, self.rng):
+                    person.get_infected(self)
 
         # stay outside for some time
         yield self.env.timeout(outside_time)
@@ -245,29 +306,51 @@ class Person(object):
         self.location = self.home
     
     def rebirth(self):
+        if self.state == SIR.infectious:
+            ledger.record_removal(self.name)
         self.__init__(self.env)
         debug(f"P{self.name} is born.")
 
 
-    def get_infected(self): 
+    def get_infected(self, infector=None):
         self.state = SIR.infectious
         self.infection_time = self.env.now
-        debug(f"P{self.name} got infected.")       
+        ledger.record_infection(self.env.now, self.name,
+            infector=infector.name if infector else InfectionLedger.NO_INFECTOR, location=self.location)
+        debug(f"P{self.name} got infected.")
 
     def recover(self):
         if self.state == SIR.infectious:
             infectious_time = self.env.now - self.infection_time
             if infectious_time >= self.recover_time:
                 self.state = SIR.recovered
+                ledger.record_removal(self.name)
                 debug(f"P{self.name} recovered.")
 
+def people_from_template(env, template):
+    '''Creates one Person per agent of the PopulationTemplate without drawing any attribute
+        The template only saves the attribute draws and shares them between replicates:
+        every agent still becomes a Person with its own SimPy process, which is most of the
+        startup time (about 0.4 s per 100k agents, 5 s for a million), so a million agents
+        do not start in under a second.'''
+    names = template.name.tolist()
+    homes = zip(template.home_x.tolist(), template.home_y.tolist())
+    lifespans, recover_times = template.lifespan.tolist(), template.recover_time.tolist()
+    with gc_paused():
+        people = [Person(env, name=name, home=home, lifespan=lifespan, recover_time=recover_time)
+            for name, home, lifespan, recover_time in zip(names, homes, lifespans, recover_times)]
+    # names of reborn people continue after the template
+    Person.people_counter = max(getattr(Person, 'people_counter', 0), max(names, default=0))
+    return people
+
 def plot_results():
     global T, S, I, R 
-    global β, λ, γ, R0, Reff
+    global β, λ, γ, R0, Reff, Rc
     print(f"Plotting {len(T)} data points.")
+    dT, (dS, dI, dR) = decimate_many(T, (S, I, R))
 
     plt.figure()
-    plt.stackplot(T, R, I, S, labels=("Recovered, Infectious, Susceptible"), colors=("green", "orange", "blue"))
+    plt.stackplot(dT, dR, dI, dS, labels=("Recovered, Infectious, Susceptible"), colors=("green", "orange", "blue"))
     plt.title("SIR Stackplot")
     plt.xlabel("Time [h]")
     plt.ylabel("People")
@@ -284,7 +367,7 @@ def plot_results():
     ))
 
     plt.figure()
-    plt.plot(T, S, T, I, T, R)
+    plt.plot(dT, dS, dT, dI, dT, dR)
     plt.title("SIR Plot")
     plt.xlabel("Time [h]")
     plt.ylabel("People")
@@ -314,14 +397,15 @@ def plot_results():
     ))
 
     plt.figure()
-    plt.plot(stats_T, R0, stats_T, Reff)
-    plt.title("SIR R0, Reff")
+    plt.plot(stats_T, R0, stats_T, Reff, stats_T, Rc)
+    plt.title("SIR R0, Reff, Rc")
     plt.xlabel("Time [d]")
-    plt.ylabel("R0, Reff")
+    plt.ylabel("R0, Reff, Rc")
     plt.xlim(0, len(stats_T))
     plt.legend((
         "R0", 
         "Reff", 
+        "Rc (ledger)", 
     ))
     plt.show()
 
@@ -338,7 +422,10 @@ if __name__ == "__main__":
     stats_process = env.process(update_stats(env))
 
     # Create Person
-    people = [Person(env) for i in range(num_people)]
+    if population_template:
+        people = people_from_template(env, PopulationTemplate.load(population_template))
+    else:
+        people = create_people(env, num_people)
 
     # i=1
     # # Add Person to simulation environment
@@ -348,7 +435,7 @@ if __name__ == "__main__":
     #     person.life_process = person.env.process(person.life())
 
     # initial infectious
-    for person in choices(people, k=initial_num_infectious):
+    for person in streams.stream(AgentStreams.GLOBAL).sample(people, k=initial_num_infectious):
         person.get_infected()
 
     # rum Simulation
@@ -356,5 +443,9 @@ if __name__ == "__main__":
     print("This might take some time...")
     env.run(sim_time)
 
+    if results_directory:
+        save_run(results_directory, f'stochastic_{run_seed}', {'T': T, 'S': S, 'I': I, 'R': R},
+            metadata={'run_seed': run_seed, 'num_people': num_people, 'infection_probability': infection_probability})
+
     # plot simulation results
     plot_results()
\ No newline at end of file